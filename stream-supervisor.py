@@ -3,58 +3,131 @@
 Stream supervisor: watches /app/videos and manages FFmpeg streaming processes
 Includes HTTP API for stream control
 """
+import functools
+import gzip
 import json
 import os
 import re
+import signal
 import socket
 import subprocess
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 
-# Note: inotify doesn't work on network filesystems (CIFS/NFS), so we use polling
+# orjson serializes dict-of-strings several times faster than stdlib json;
+# fall back quietly if it isn't installed
+try:
+    import orjson
+
+    def _json_dumps(data):
+        return orjson.dumps(data)
+except ImportError:
+    def _json_dumps(data):
+        return json.dumps(data).encode()
+
+# Prefer watchdog (inotify on local filesystems) for change detection.
+# inotify doesn't work on network filesystems (CIFS/NFS), so we fall back
+# to polling there, or everywhere if watchdog isn't installed.
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+    HAVE_WATCHDOG = True
+except ImportError:
+    FileSystemEventHandler = object
+    HAVE_WATCHDOG = False
 
 VIDEOS_DIR = Path("/app/videos")
 STREAM_VIDEO_SCRIPT = "stream-video.sh"
 RTSP_PORT = int(os.getenv("MEDIAMTX_RTSP_PORT", "8554"))
 API_PORT = int(os.getenv("STREAM_API_PORT", "8080"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+# Cap on simultaneous ffmpeg processes; each one transcodes, so an unbounded
+# start-all can thrash the CPU
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "8"))
+# Force the polling watcher even when watchdog is available
+USE_POLLING = os.getenv("USE_POLLING", "0") == "1"
 
 # Get hostname from environment (required)
 HOSTNAME = os.getenv("CONTAINER_NAME")
 if not HOSTNAME:
     raise RuntimeError("CONTAINER_NAME environment variable is not set")
 
-# Track running streams: {stream_name: {"process": process, "video_path": path, "loop_count": int}}
+@dataclass(slots=True)
+class StreamInfo:
+    """Per-stream record; slotted to avoid a per-entry dict and string-keyed lookups"""
+    process: subprocess.Popen
+    video_path: str
+    loop_count: int
+    pid: int
+
+
+# Track running streams: {stream_name: StreamInfo}
 streams = {}
 # Track available videos: {stream_name: video_path}
 available_videos = {}
 # Track last used loop count per stream (persists across stop/start)
 stream_loop_counts = {}
 
+# Guards streams/available_videos/stream_loop_counts: API handlers run on
+# their own threads, so mutations must not interleave with the watcher.
+# Hold it only for dict reads/writes — never across Popen or process.wait,
+# which would stall every other handler behind one slow stream.
+_state_lock = threading.RLock()
+# Stream names with a spawn in flight, so concurrent starts don't double-spawn
+_starting = set()
+# Reverse map pid -> stream_name for the SIGCHLD reaper
+_stream_pids = {}
+# Set by the SIGCHLD handler, drained by the reaper thread
+_reap_event = threading.Event()
+# One slot per running ffmpeg process; starts beyond the cap are queued in
+# _pending_starts as (name, loop_count) pairs and launched as slots free up
+_stream_slots = threading.BoundedSemaphore(MAX_CONCURRENT_STREAMS)
+_pending_starts = deque()
+
+
+def _queued_stream_names():
+    """Names currently waiting for a slot; callers must hold _state_lock"""
+    return [name for name, _ in _pending_starts]
+
 
 def log(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] {message}", flush=True)
 
 
-def sanitize_name(filepath):
+# Compiled once: sanitize_name runs per directory entry on every poll
+_INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_-]')
+_DUP_UNDERSCORES = re.compile(r'_+')
+_DUP_DASHES = re.compile(r'-+')
+
+
+@functools.lru_cache(maxsize=1024)
+def sanitize_name(filename):
     """Convert filename to valid stream name"""
-    # Remove extension
-    name = Path(filepath).stem
+    # Remove directory and extension with plain string ops; building a Path
+    # just to read .stem costs an os.fspath call and a split per invocation
+    name = filename.rsplit('/', 1)[-1]
+    dot = name.rfind('.')
+    if dot > 0:
+        name = name[:dot]
 
     # Replace invalid characters with underscore
-    name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
+    name = _INVALID_CHARS.sub('_', name)
 
     # Convert to lowercase
     name = name.lower()
 
     # Collapse multiple underscores/dashes
-    name = re.sub(r'_+', '_', name)
-    name = re.sub(r'-+', '-', name)
+    name = _DUP_UNDERSCORES.sub('_', name)
+    name = _DUP_DASHES.sub('-', name)
 
     # Strip leading/trailing underscores/dashes
     name = name.strip('_-')
@@ -64,20 +137,36 @@ def sanitize_name(filepath):
 
 def wait_for_mediamtx():
     log(f"Waiting for MediaMTX to be available on port {RTSP_PORT}...")
+    # Start probing quickly (MediaMTX usually comes up within a few hundred
+    # ms of us) and back off exponentially so a slow start doesn't busy-loop
+    backoff = 0.1
     while True:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(1)
-                sock.connect(("localhost", RTSP_PORT))
-                break
-        except (ConnectionRefusedError, socket.timeout, OSError):
-            time.sleep(1)
+            socket.create_connection(("localhost", RTSP_PORT), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(backoff)
+            backoff = min(backoff * 1.5, 5)
     log("MediaMTX is ready")
 
 
 def start_stream(video_path, stream_name, loop_count=-1):
-    if stream_name in streams:
-        log(f"Stream already running: {stream_name}")
+    # Spawn outside the lock so parallel starts don't serialize on fork+exec;
+    # _starting reserves the name while the spawn is in flight
+    with _state_lock:
+        if stream_name in streams or stream_name in _starting:
+            log(f"Stream already running: {stream_name}")
+            return False
+        _starting.add(stream_name)
+
+    if not _stream_slots.acquire(blocking=False):
+        # At capacity: queue the start (with its requested loop count, which
+        # isn't recorded anywhere else yet); a slot-release drains the queue
+        with _state_lock:
+            _starting.discard(stream_name)
+            if stream_name not in _queued_stream_names():
+                _pending_starts.append((stream_name, loop_count))
+        log(f"Stream capacity reached ({MAX_CONCURRENT_STREAMS}), queued: {stream_name}")
         return False
 
     try:
@@ -88,25 +177,80 @@ def start_stream(video_path, stream_name, loop_count=-1):
         else:
             process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-        streams[stream_name] = {"process": process, "video_path": str(video_path), "loop_count": loop_count}
-        available_videos[stream_name] = str(video_path)
-        stream_loop_counts[stream_name] = loop_count
+        with _state_lock:
+            streams[stream_name] = StreamInfo(process=process, video_path=str(video_path),
+                                              loop_count=loop_count, pid=process.pid)
+            available_videos[stream_name] = str(video_path)
+            stream_loop_counts[stream_name] = loop_count
+            _stream_pids[process.pid] = stream_name
+
+        # If the child died between Popen and the registration above, the
+        # SIGCHLD reaper may have already collected it with no entry to
+        # match, leaving a dead stream listed as running until the safety
+        # sweep. poll() catches both cases: a normal early exit, or 0 via
+        # the ECHILD path when the reaper got there first.
+        if process.poll() is not None:
+            with _state_lock:
+                was_tracked = streams.pop(stream_name, None) is not None
+                _stream_pids.pop(process.pid, None)
+            if was_tracked:
+                log(f"Process ended: {stream_name}")
+                _release_stream_slot()
+            return False
 
         rtsp_url = f"rtsp://{HOSTNAME}:{RTSP_PORT}/{stream_name}"
         log(f"Now playing {rtsp_url}")
         return True
     except Exception as e:
         log(f"Failed to start stream {stream_name}: {e}")
+        _release_stream_slot()
         return False
+    finally:
+        with _state_lock:
+            _starting.discard(stream_name)
+
+
+def _release_stream_slot():
+    """Free a concurrency slot and start the next queued stream, if any"""
+    try:
+        _stream_slots.release()
+    except ValueError:
+        # More releases than acquires; nothing to free
+        return
+
+    while True:
+        with _state_lock:
+            if not _pending_starts:
+                return
+            name, loop_count = _pending_starts.popleft()
+            video_path = available_videos.get(name)
+        if video_path is None:
+            continue  # Video disappeared while queued; try the next one
+        log(f"Starting queued stream: {name}")
+        start_stream(video_path, name, loop_count)
+        return
 
 
 def stop_stream(stream_name):
-    if stream_name not in streams:
+    # Remove the entry under the lock, but run terminate + the up-to-5s wait
+    # outside it so parallel stops don't serialize
+    with _state_lock:
+        stream_info = streams.pop(stream_name, None)
+        if stream_info is not None:
+            _stream_pids.pop(stream_info.pid, None)
+        else:
+            # Not running, but it may be waiting for a slot
+            for entry in _pending_starts:
+                if entry[0] == stream_name:
+                    _pending_starts.remove(entry)
+                    log(f"Removed queued stream: {stream_name}")
+                    return True
+
+    if stream_info is None:
         log(f"Stream not found: {stream_name}")
         return False
 
-    stream_info = streams[stream_name]
-    process = stream_info["process"]
+    process = stream_info.process
     try:
         process.terminate()
         try:
@@ -118,7 +262,7 @@ def stop_stream(stream_name):
     except Exception as e:
         log(f"Error stopping stream {stream_name}: {e}")
 
-    del streams[stream_name]
+    _release_stream_slot()
     return True
 
 
@@ -139,11 +283,45 @@ def scan_videos():
         log(f"Directory does not exist: {VIDEOS_DIR}")
         return
 
-    for video_path in VIDEOS_DIR.iterdir():
-        if not video_path.is_file() or video_path.name.startswith('.'):
-            continue
-        stream_name = sanitize_name(video_path)
-        available_videos[stream_name] = str(video_path)
+    with os.scandir(VIDEOS_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            available_videos[sanitize_name(entry.name)] = entry.path
+
+
+# Fan-out width for bulk start/stop; spawns are fork+exec-bound, not CPU-bound
+_MAX_SYNC_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+
+
+def start_all_streams():
+    """Start every available video that isn't already streaming, in parallel"""
+    with _state_lock:
+        pending = [(name, video_path, stream_loop_counts.get(name, -1))
+                   for name, video_path in available_videos.items()
+                   if name not in streams]
+
+    if not pending:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=_MAX_SYNC_WORKERS) as executor:
+        futures = [executor.submit(start_stream, video_path, name, loop_count)
+                   for name, video_path, loop_count in pending]
+        return sum(1 for future in as_completed(futures) if future.result())
+
+
+def stop_all_streams():
+    """Stop all running streams in parallel (terminate + wait can take 5s each)"""
+    with _state_lock:
+        _pending_starts.clear()
+        names = tuple(streams)
+
+    if not names:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=_MAX_SYNC_WORKERS) as executor:
+        futures = [executor.submit(stop_stream, name) for name in names]
+        return sum(1 for future in as_completed(futures) if future.result())
 
 
 def sync_videos():
@@ -151,45 +329,87 @@ def sync_videos():
     log(f"Scanning {VIDEOS_DIR} for video files...")
     scan_videos()
 
-    count = 0
-    for stream_name, video_path in available_videos.items():
-        if start_stream(video_path, stream_name):
-            count += 1
-
+    count = start_all_streams()
     log(f"Initial sync complete: {count} streams started")
 
 
 def handle_create(filepath, event_type="added"):
-    path = Path(filepath)
+    filepath = str(filepath)
+    filename = os.path.basename(filepath)
 
     # Skip hidden files
-    if path.name.startswith('.'):
+    if filename.startswith('.'):
         return
 
-    stream_name = sanitize_name(path)
-    available_videos[stream_name] = str(path)
-    log(f"Video {event_type}: {path.name}")
-    start_stream(path, stream_name)
+    # Only the available_videos update needs the lock; the spawn runs
+    # outside it so a new file doesn't stall API handlers
+    stream_name = sanitize_name(filename)
+    with _state_lock:
+        available_videos[stream_name] = filepath
+    log(f"Video {event_type}: {filename}")
+    start_stream(filepath, stream_name)
 
 
 def handle_delete(filepath, event_type="deleted"):
-    path = Path(filepath)
-    stream_name = sanitize_name(path)
-    log(f"Video {event_type}: {path.name}")
+    filename = os.path.basename(str(filepath))
+    stream_name = sanitize_name(filename)
+    log(f"Video {event_type}: {filename}")
+    # stop_stream waits up to 5s for ffmpeg to exit; keep that outside the
+    # lock so a deleted file doesn't stall API handlers
     stop_stream(stream_name)
-    if stream_name in available_videos:
-        del available_videos[stream_name]
+    with _state_lock:
+        available_videos.pop(stream_name, None)
 
 
 def cleanup_dead_processes():
-    dead_streams = []
-    for stream_name, info in streams.items():
-        if info["process"].poll() is not None:
+    """Safety sweep: poll every tracked process (the SIGCHLD reaper normally wins)"""
+    with _state_lock:
+        dead_streams = [stream_name for stream_name, info in streams.items()
+                        if info.process.poll() is not None]
+        for stream_name in dead_streams:
             log(f"Process ended: {stream_name}")
-            dead_streams.append(stream_name)
+            _stream_pids.pop(streams[stream_name].pid, None)
+            streams.pop(stream_name, None)
 
-    for stream_name in dead_streams:
-        del streams[stream_name]
+    for _ in dead_streams:
+        _release_stream_slot()
+
+
+def _on_sigchld(signum, frame):
+    # Keep the handler trivial; the reaper thread does the real work
+    _reap_event.set()
+
+
+def reap_children():
+    """Reap dead ffmpeg processes as SIGCHLD arrives instead of polling each pid
+
+    One waitpid(-1) drain per batch of exits replaces a waitpid syscall per
+    tracked process every sweep, and reacts within milliseconds of a stream
+    dying instead of up to 30 seconds later.
+    """
+    while True:
+        _reap_event.wait()
+        _reap_event.clear()
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break  # No children left at all
+            if pid == 0:
+                break  # Children exist but none have exited
+
+            removed = False
+            with _state_lock:
+                stream_name = _stream_pids.pop(pid, None)
+                if stream_name is not None and stream_name in streams:
+                    # Record the exit so a later Popen.poll()/wait() doesn't
+                    # try to collect the already-reaped child
+                    streams[stream_name].process.returncode = os.waitstatus_to_exitcode(status)
+                    log(f"Process ended: {stream_name}")
+                    del streams[stream_name]
+                    removed = True
+            if removed:
+                _release_stream_slot()
 
 
 HTML_PAGE = """<!DOCTYPE html>
@@ -291,34 +511,87 @@ HTML_PAGE = """<!DOCTYPE html>
 </html>
 """
 
+# Encoded once at import: the page and the 404 body are constant, so don't
+# re-encode them on every request. The gzip variant is ~4x smaller on the
+# wire (mostly CSS and JS) and costs nothing after import.
+_HTML_BYTES = HTML_PAGE.encode('utf-8')
+_HTML_GZ = gzip.compress(_HTML_BYTES, compresslevel=9)
+_NOT_FOUND_BYTES = json.dumps({"error": "Not found"}).encode()
+
 
 class StreamHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between the UI's 5-second polls
+    # instead of paying TCP setup each time; requires Content-Length on
+    # every response body so the client knows where each one ends
+    protocol_version = 'HTTP/1.1'
+    # Sets TCP_NODELAY on each accepted connection: Nagle can hold small
+    # JSON replies back by up to 40ms waiting for a full segment
+    disable_nagle_algorithm = True
+
     def log_message(self, format, *args):
         pass  # Suppress default logging
 
-    def send_json(self, data, status=200):
+    def send_json_bytes(self, body, status=200, headers=None):
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if headers:
+            for name, value in headers.items():
+                self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
 
-    def send_html(self, html):
+    def send_json(self, data, status=200):
+        self.send_json_bytes(_json_dumps(data), status)
+
+    def send_html(self, body, content_encoding=None):
         self.send_response(200)
         self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
         self.end_headers()
-        self.wfile.write(html.encode())
+        self.wfile.write(body)
 
     def do_GET(self):
         parsed = urlparse(self.path)
         if parsed.path == '/' or parsed.path == '/index.html':
-            self.send_html(HTML_PAGE)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self.send_html(_HTML_GZ, content_encoding='gzip')
+            else:
+                self.send_html(_HTML_BYTES)
         elif parsed.path == '/api/streams':
-            self.send_json(get_stream_status())
+            # Most polls see unchanged state; an ETag lets the browser
+            # revalidate with a 304 and skip serialization entirely
+            with _state_lock:
+                etag = '"%x"' % (hash((frozenset(available_videos.items()),
+                                       frozenset(streams),
+                                       frozenset(stream_loop_counts.items())))
+                                 & 0xFFFFFFFFFFFFFFFF)
+                if self.headers.get('If-None-Match') == etag:
+                    body = None
+                else:
+                    body = _json_dumps(get_stream_status())
+            if body is None:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+            else:
+                self.send_json_bytes(body, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
         else:
-            self.send_json({"error": "Not found"}, 404)
+            self.send_json_bytes(_NOT_FOUND_BYTES, 404)
 
     def do_POST(self):
+        # The API ignores request bodies, but unread bytes would be parsed
+        # as the start of the next request on this persistent connection,
+        # so drain whatever the client sent
+        body_length = int(self.headers.get('Content-Length') or 0)
+        if body_length:
+            self.rfile.read(body_length)
+
         parsed = urlparse(self.path)
         path_parts = parsed.path.strip('/').split('/')
 
@@ -328,30 +601,51 @@ class StreamHandler(BaseHTTPRequestHandler):
 
             # Handle stop-all and start-all
             if stream_name == 'stop-all':
-                for name in list(streams.keys()):
-                    stop_stream(name)
+                stop_all_streams()
                 self.send_json({"success": True})
                 return
 
             if stream_name == 'start-all':
-                for name, video_path in available_videos.items():
-                    if name not in streams:
-                        loop_count = stream_loop_counts.get(name, -1)
-                        start_stream(video_path, name, loop_count)
-                self.send_json({"success": True})
+                started = start_all_streams()
+                with _state_lock:
+                    queued = len(_pending_starts)
+                self.send_json({"success": True, "started": started, "queued": queued})
                 return
 
             if action == 'start':
-                if stream_name not in available_videos:
-                    self.send_json({"error": "Stream not found"}, 404)
-                    return
                 query = parse_qs(parsed.query)
                 loop_count = int(query.get('loop', ['-1'])[0])
-                # Stop first if already running
-                if stream_name in streams:
+                with _state_lock:
+                    # One lock scope for the availability lookup and the
+                    # reuse decision: a concurrent handle_delete between a
+                    # separate membership check and the lookup would KeyError
+                    video_path = available_videos.get(stream_name)
+                    # Reuse the running ffmpeg if the settings are unchanged:
+                    # a respawn costs fork+exec plus ffmpeg's codec probe and
+                    # RTSP handshake for no visible difference
+                    info = streams.get(stream_name)
+                    reuse = (info is not None and info.loop_count == loop_count
+                             and info.process.poll() is None)
+                    restart = not reuse and stream_name in streams
+                if video_path is None:
+                    self.send_json({"error": "Stream not found"}, 404)
+                    return
+                if reuse:
+                    self.send_json({"success": True})
+                    return
+                # Stop first if already running. Both calls run outside the
+                # lock: the stop can wait up to 5s for ffmpeg to exit, and
+                # holding the lock through that would stall every handler
+                if restart:
                     stop_stream(stream_name)
-                success = start_stream(available_videos[stream_name], stream_name, loop_count)
-                self.send_json({"success": success})
+                success = start_stream(video_path, stream_name, loop_count)
+                if success:
+                    self.send_json({"success": True})
+                else:
+                    # Distinguish "waiting for a slot" from an actual failure
+                    with _state_lock:
+                        queued = stream_name in _queued_stream_names()
+                    self.send_json({"success": False, "queued": queued})
 
             elif action == 'stop':
                 success = stop_stream(stream_name)
@@ -360,29 +654,177 @@ class StreamHandler(BaseHTTPRequestHandler):
             else:
                 self.send_json({"error": "Unknown action"}, 400)
         else:
-            self.send_json({"error": "Not found"}, 404)
+            self.send_json_bytes(_NOT_FOUND_BYTES, 404)
 
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 
+class StreamAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # SO_REUSEPORT lets additional supervisor replicas bind the same
+        # port if we ever need to scale past one process (not on all
+        # platforms, so probe for it)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
 def start_api_server():
-    server = HTTPServer(('0.0.0.0', API_PORT), StreamHandler)  # type: ignore[arg-type]
+    # ThreadingHTTPServer handles each request on its own thread so a slow
+    # request can't block the UI's 5-second polling or concurrent tabs.
+    # An asyncio server (aiohttp/uvicorn) would scale further, but this
+    # supervisor is stdlib-only by design and the request load is a handful
+    # of polling browser tabs. Shrink the per-request thread stacks instead:
+    # the default 8MB virtual stack is overkill for handlers that just read
+    # dicts and write JSON.
+    threading.stack_size(512 * 1024)
+    server = StreamAPIServer(('0.0.0.0', API_PORT), StreamHandler)  # type: ignore[arg-type]
     log(f"Stream Control UI: http://localhost:9080")
     server.serve_forever()
 
 
 def get_video_files():
     """Scan directory and return dict of {filename: mtime}"""
-    files = {}
-    for video_path in VIDEOS_DIR.iterdir():
-        if video_path.is_file() and not video_path.name.startswith('.'):
-            files[video_path.name] = video_path.stat().st_mtime
-    return files
+    # os.scandir returns stat info gathered during the directory read, so
+    # this is one batched syscall instead of a stat per file (which on CIFS
+    # means one network round-trip per file)
+    with os.scandir(VIDEOS_DIR) as entries:
+        return {entry.name: entry.stat(follow_symlinks=False).st_mtime
+                for entry in entries
+                if entry.is_file() and not entry.name.startswith('.')}
+
+
+class VideoEventHandler(FileSystemEventHandler):
+    """Translate watchdog events into stream start/stop calls
+
+    Created and modified events are debounced: both fire repeatedly while a
+    file is copied in, so each path must stay quiet for DEBOUNCE_SECONDS
+    before its stream is (re)started. This also gives the watchdog path the
+    same replaced-file handling as the polling watcher: an in-place
+    overwrite restarts the stream so the new content plays.
+    """
+
+    DEBOUNCE_SECONDS = 2
+
+    @staticmethod
+    def _hidden(filepath):
+        # Hidden files never become streams, and sanitize_name strips the
+        # leading '._', so a macOS sidecar like '._foo.mp4' would otherwise
+        # collide with the live 'foo' stream. The polling watcher filters
+        # these before diffing; do the same here.
+        return os.path.basename(filepath).startswith('.')
+
+    def __init__(self):
+        super().__init__()
+        self._timers = {}
+        self._timers_lock = threading.Lock()
+
+    def _schedule(self, filepath):
+        if self._hidden(filepath):
+            return
+        with self._timers_lock:
+            timer = self._timers.pop(filepath, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.DEBOUNCE_SECONDS, self._settled, args=(filepath,))
+            timer.daemon = True
+            self._timers[filepath] = timer
+            timer.start()
+
+    def _cancel(self, filepath):
+        with self._timers_lock:
+            timer = self._timers.pop(filepath, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _settled(self, filepath):
+        with self._timers_lock:
+            self._timers.pop(filepath, None)
+        if self._hidden(filepath):
+            # Never scheduled for hidden paths, but guard anyway: a hidden
+            # '._foo.mp4' sanitizes to 'foo' and would restart that stream
+            return
+        stream_name = sanitize_name(os.path.basename(filepath))
+        with _state_lock:
+            known = stream_name in available_videos
+        if known:
+            handle_delete(filepath, "replaced")
+            handle_create(filepath, "replaced")
+        else:
+            handle_create(filepath, "added")
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory and not self._hidden(event.src_path):
+            self._cancel(event.src_path)
+            handle_delete(event.src_path, "removed")
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        if not self._hidden(event.src_path):
+            self._cancel(event.src_path)
+            handle_delete(event.src_path, "moved away")
+        # A rename from a hidden temp name (rsync, SMB copies) is how new
+        # files usually arrive, so the destination is handled either way
+        if not self._hidden(event.dest_path):
+            handle_create(event.dest_path, "moved in")
+
+
+def is_network_mount(path):
+    """Check /proc/mounts to see if path lives on CIFS/NFS (inotify won't work there)"""
+    try:
+        best_fstype = None
+        best_len = -1
+        with open("/proc/mounts") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point, fstype = parts[1], parts[2]
+                if str(path).startswith(mount_point) and len(mount_point) > best_len:
+                    best_len = len(mount_point)
+                    best_fstype = fstype
+        return best_fstype in ("cifs", "smb3", "nfs", "nfs4")
+    except OSError:
+        # Can't tell; assume network to be safe (polling always works)
+        return True
+
+
+def watch_directory_events():
+    """Watch directory using watchdog (inotify locally, polling observer on network FS)"""
+    if is_network_mount(VIDEOS_DIR):
+        log(f"Watching {VIDEOS_DIR} for changes (watchdog polling observer)...")
+        observer = PollingObserver(timeout=2)
+    else:
+        log(f"Watching {VIDEOS_DIR} for changes (inotify)...")
+        observer = Observer()
+
+    observer.daemon = True
+    observer.schedule(VideoEventHandler(), str(VIDEOS_DIR))
+    observer.start()
+
+    # Events arrive on the observer's thread; this thread just does the
+    # periodic safety sweep (the SIGCHLD reaper handles the common case)
+    while True:
+        time.sleep(300)
+        cleanup_dead_processes()
 
 
 def watch_directory():
@@ -390,52 +832,92 @@ def watch_directory():
     log(f"Watching {VIDEOS_DIR} for changes (polling mode)...")
 
     last_cleanup = time.time()
+    last_full_scan = time.time()
     known_files = get_video_files()
+    known_dir_mtime = VIDEOS_DIR.stat().st_mtime
+    videos_dir = str(VIDEOS_DIR)  # join strings in the loop, not Path objects
 
     while True:
         time.sleep(2)  # Poll every 2 seconds
 
+        # Periodic safety sweep (the SIGCHLD reaper handles the common case)
+        if time.time() - last_cleanup > 300:
+            cleanup_dead_processes()
+            last_cleanup = time.time()
+
         try:
+            # Most filesystems (CIFS included) bump the parent directory
+            # mtime on create/delete, so skip the per-file scan when the
+            # directory is untouched. Full-scan every 30 seconds anyway in
+            # case the mount doesn't maintain parent mtime reliably.
+            dir_mtime = VIDEOS_DIR.stat().st_mtime
+            if dir_mtime == known_dir_mtime and time.time() - last_full_scan < 30:
+                continue
+            known_dir_mtime = dir_mtime
+            last_full_scan = time.time()
+
             current_files = get_video_files()
 
-            # Check for new files
-            for filename in current_files:
-                if filename not in known_files:
-                    filepath = VIDEOS_DIR / filename
-                    handle_create(filepath, "added")
+            # Diff with set arithmetic on the key views (runs in C, one
+            # pass) instead of per-file membership loops
+            added = current_files.keys() - known_files.keys()
+            removed = known_files.keys() - current_files.keys()
+            changed = {filename for filename in current_files.keys() & known_files.keys()
+                       if current_files[filename] != known_files[filename]}
 
-            # Check for deleted files
-            for filename in list(known_files.keys()):
-                if filename not in current_files:
-                    filepath = VIDEOS_DIR / filename
-                    handle_delete(filepath, "removed")
+            for filename in added:
+                handle_create(os.path.join(videos_dir, filename), "added")
+
+            for filename in removed:
+                handle_delete(os.path.join(videos_dir, filename), "removed")
+
+            # A replaced file keeps its name but gets a new mtime; restart
+            # its stream so the new content plays
+            for filename in changed:
+                filepath = os.path.join(videos_dir, filename)
+                handle_delete(filepath, "replaced")
+                handle_create(filepath, "replaced")
 
             known_files = current_files
 
         except Exception as e:
             log(f"Error scanning directory: {e}")
 
-        # Periodic cleanup every 30 seconds
-        if time.time() - last_cleanup > 30:
-            cleanup_dead_processes()
-            last_cleanup = time.time()
-
 
 def main():
     log("Stream supervisor starting...")
 
+    # Reap dead ffmpeg processes on SIGCHLD (handler must be installed from
+    # the main thread)
+    signal.signal(signal.SIGCHLD, _on_sigchld)
+    threading.Thread(target=reap_children, daemon=True).start()
+
     # Wait for MediaMTX
     wait_for_mediamtx()
 
-    # Start API server in background thread
-    api_thread = threading.Thread(target=start_api_server, daemon=True)
-    api_thread.start()
-
-    # Initial sync
-    sync_videos()
-
-    # Watch for changes
-    watch_directory()
+    # Initial sync and directory watching run in the background; the API
+    # server owns the main thread instead of a dedicated handoff thread.
+    # (A shared asyncio loop was considered, but the stdlib http.server
+    # stack doesn't integrate with one; this gets the same thread count.)
+    def sync_and_watch():
+        # The videos volume can lag container start (CIFS mounts
+        # especially). A daemon thread that dies would leave the supervisor
+        # serving an empty API forever, so retry instead of crashing.
+        while True:
+            try:
+                sync_videos()
+                if HAVE_WATCHDOG and not USE_POLLING:
+                    watch_directory_events()
+                else:
+                    watch_directory()
+            except Exception as e:
+                log(f"Watcher error: {e}; retrying in 5 seconds")
+                time.sleep(5)
+
+    threading.Thread(target=sync_and_watch, daemon=True).start()
+
+    # Serve the API on the main thread
+    start_api_server()
 
 
 if __name__ == "__main__":